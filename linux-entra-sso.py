@@ -7,7 +7,7 @@
 # Renable invalid-name check, it should only cover the module name
 # pylint: enable=invalid-name
 
-import argparse
+import os
 import sys
 import json
 import struct
@@ -19,6 +19,22 @@ from threading import Thread, Lock
 from gi.repository import GLib, Gio
 from pydbus import SessionBus
 
+try:
+    # orjson is significantly faster than the stdlib codec and
+    # operates on bytes directly, but it is an optional dependency.
+    from orjson import dumps as _json_dumps, loads as _json_loads
+except ImportError:
+
+    def _json_dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def _json_loads(data):
+        # unlike orjson, the stdlib parser rejects memoryviews
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
 # version is replaced on installation
 LINUX_ENTRA_SSO_VERSION = "0.0.0-dev"
 
@@ -34,40 +50,72 @@ START_REPLY_SUCCESS = 1
 START_REPLY_ALREADY_RUNNING = 2
 # prctl constants
 PR_SET_PDEATHSIG = 1
+# native-messaging length header (32 bit, native endianness),
+# precompiled to avoid re-parsing the format string per message
+_U32 = struct.Struct("@I")
+# raw stdout fd for the response path; writing the fd directly skips
+# the BufferedWriter copy, which is pure overhead for complete frames
+_STDOUT_FD = sys.stdout.fileno()
 
 
 class NativeMessaging:
+    # The message content must stay UTF-8 encoded JSON: the browser
+    # itself (de)serializes the payload of runtime.connectNative, so a
+    # binary encoding cannot be negotiated with the extension.
+
+    # reusable receive buffer, sized well above the largest command
+    # the extension sends (browsers cap host-bound messages anyway)
+    _RECV_BUF = bytearray(64 * 1024)
+
     @staticmethod
     def get_message():
         """
         Read a message from stdin and decode it.
         """
-        raw_length = sys.stdin.buffer.read(4)
-        if not raw_length:
+        buf = memoryview(NativeMessaging._RECV_BUF)
+        if sys.stdin.buffer.readinto(buf[:4]) != 4:
             sys.exit(0)
-        message_length = struct.unpack("@I", raw_length)[0]
-        message = sys.stdin.buffer.read(message_length).decode("utf-8")
-        return json.loads(message)
+        message_length = _U32.unpack_from(buf)[0]
+        if message_length > len(buf):
+            # oversized message, fall back to a one-off allocation
+            return _json_loads(sys.stdin.buffer.read(message_length))
+        if sys.stdin.buffer.readinto(buf[:message_length]) != message_length:
+            sys.exit(0)
+        return _json_loads(buf[:message_length])
 
     @staticmethod
     def encode_message(message_content):
         """
-        Encode a message for transmission, given its content
+        Encode a message for transmission, given its content.
+        Returns the complete frame (length header plus content).
+        """
+        encoded_content = _json_dumps(message_content)
+        return _U32.pack(len(encoded_content)) + encoded_content
+
+    @staticmethod
+    def encode_raw_message(command, raw_message):
+        """
+        Encode a message whose payload is already serialized JSON,
+        splicing it into the envelope without an intermediate parse.
         """
-        encoded_content = json.dumps(message_content, separators=(",", ":")).encode(
-            "utf-8"
+        encoded_content = (
+            b'{"command":"%s","message":' % command.encode("ascii")
+            + raw_message.encode("utf-8")
+            + b"}"
         )
-        encoded_length = struct.pack("@I", len(encoded_content))
-        return {"length": encoded_length, "content": encoded_content}
+        return _U32.pack(len(encoded_content)) + encoded_content
 
     @staticmethod
-    def send_message(encoded_message):
+    def send_message(frame):
         """
-        Send an encoded message to stdout
+        Send an encoded frame to stdout
         """
-        sys.stdout.buffer.write(encoded_message["length"])
-        sys.stdout.buffer.write(encoded_message["content"])
-        sys.stdout.buffer.flush()
+        # write the raw fd directly: typical frames fit in one
+        # syscall and nothing else writes to stdout in this mode
+        view = memoryview(frame)
+        while view:
+            written = os.write(_STDOUT_FD, view)
+            view = view[written:]
 
 
 class SsoMib:
@@ -78,13 +126,27 @@ class SsoMib:
     def __init__(self, daemon=False):
         self._bus = SessionBus()
         self.broker = None
-        self.session_id = uuid.uuid4()
+        self._session_id = None
         self._state_changed_cb = None
         if daemon:
             self._introspect_broker(fail_on_error=False)
             self._monitor_bus()
 
+    @property
+    def session_id(self):
+        """
+        Session id passed to the broker, generated on first use so
+        that process startup does not pay for the entropy read.
+        """
+        if self._session_id is None:
+            self._session_id = uuid.uuid4()
+        return self._session_id
+
     def _introspect_broker(self, fail_on_error=True):
+        # the proxy is kept across requests; it is only dropped when
+        # the broker leaves the bus (see _broker_state_changed)
+        if self.broker:
+            return
         timeout = time.time() + BROKER_START_TIMEOUT
         while not self.broker and time.time() < timeout:
             try:
@@ -155,36 +217,49 @@ class SsoMib:
         resp = self.broker.getAccounts("0.0", str(self.session_id), json.dumps(context))
         return json.loads(resp)
 
-    def acquire_prt_sso_cookie(
+    def acquire_prt_sso_cookie_raw(
         self, account, sso_url, scopes=GRAPH_SCOPES
     ):  # pylint: disable=dangerous-default-value
+        """
+        Request a PRT SSO cookie and return the broker's JSON
+        response unparsed, so callers that only forward it can
+        skip the decode/re-encode round-trip.
+        """
         self._introspect_broker()
         request = {
             "account": account,
             "authParameters": SsoMib._get_auth_parameters(account, scopes),
             "ssoUrl": sso_url,
         }
-        token = json.loads(
-            self.broker.acquirePrtSsoCookie(
-                "0.0", str(self.session_id), json.dumps(request)
-            )
+        return self.broker.acquirePrtSsoCookie(
+            "0.0", str(self.session_id), json.dumps(request)
         )
-        return token
 
-    def acquire_token_silently(
+    def acquire_prt_sso_cookie(
+        self, account, sso_url, scopes=GRAPH_SCOPES
+    ):  # pylint: disable=dangerous-default-value
+        return json.loads(self.acquire_prt_sso_cookie_raw(account, sso_url, scopes))
+
+    def acquire_token_silently_raw(
         self, account, scopes=GRAPH_SCOPES
     ):  # pylint: disable=dangerous-default-value
+        """
+        Like acquire_token_silently, but returns the broker's JSON
+        response unparsed.
+        """
         self._introspect_broker()
         request = {
             "account": account,
             "authParameters": SsoMib._get_auth_parameters(account, scopes),
         }
-        token = json.loads(
-            self.broker.acquireTokenSilently(
-                "0.0", str(self.session_id), json.dumps(request)
-            )
+        return self.broker.acquireTokenSilently(
+            "0.0", str(self.session_id), json.dumps(request)
         )
-        return token
+
+    def acquire_token_silently(
+        self, account, scopes=GRAPH_SCOPES
+    ):  # pylint: disable=dangerous-default-value
+        return json.loads(self.acquire_token_silently_raw(account, scopes))
 
     def get_broker_version(self):
         self._introspect_broker()
@@ -196,7 +271,10 @@ class SsoMib:
         return resp
 
 
-def run_as_native_messaging():
+def run_as_native_messaging():  # pylint: disable=too-many-locals
+    # stdout is shared between the request loop and the dbus monitor
+    # thread (brokerStateChanged); the mutex keeps frames from
+    # interleaving and must stay as long as both threads respond
     iomutex = Lock()
     no_broker = {"error": "Broker not available"}
 
@@ -205,25 +283,52 @@ def run_as_native_messaging():
             NativeMessaging.encode_message({"command": command, "message": message})
         )
 
+    def respond_raw(command, raw_message):
+        NativeMessaging.send_message(
+            NativeMessaging.encode_raw_message(command, raw_message)
+        )
+
+    # the two broker state notifications are fully static, so the
+    # framed messages can be prepared once up front
+    state_frames = {
+        online: NativeMessaging.encode_message(
+            {
+                "command": "brokerStateChanged",
+                "message": "online" if online else "offline",
+            }
+        )
+        for online in (True, False)
+    }
+
     def notify_state_change(online):
         with iomutex:
-            respond("brokerStateChanged", "online" if online else "offline")
-
-    def handle_command(cmd, received_message):
-        if cmd == "acquirePrtSsoCookie":
-            account = received_message["account"]
-            sso_url = received_message["ssoUrl"] or SSO_URL_DEFAULT
-            token = ssomib.acquire_prt_sso_cookie(account, sso_url)
-            respond(cmd, token)
-        elif cmd == "acquireTokenSilently":
-            account = received_message["account"]
-            scopes = received_message.get("scopes") or ssomib.GRAPH_SCOPES
-            token = ssomib.acquire_token_silently(account, scopes)
-            respond(cmd, token)
-        elif cmd == "getAccounts":
-            respond(cmd, ssomib.get_accounts())
-        elif cmd == "getVersion":
-            respond(cmd, ssomib.get_broker_version())
+            NativeMessaging.send_message(state_frames[bool(online)])
+
+    def handle_acquire_prt_sso_cookie(received_message):
+        account = received_message["account"]
+        sso_url = received_message["ssoUrl"] or SSO_URL_DEFAULT
+        # forward the broker response as-is; parsing and
+        # re-serializing the cookie blob here would be wasted work
+        respond_raw(
+            "acquirePrtSsoCookie",
+            ssomib.acquire_prt_sso_cookie_raw(account, sso_url),
+        )
+
+    def handle_acquire_token_silently(received_message):
+        account = received_message["account"]
+        scopes = received_message.get("scopes") or ssomib.GRAPH_SCOPES
+        respond_raw(
+            "acquireTokenSilently",
+            ssomib.acquire_token_silently_raw(account, scopes),
+        )
+
+    # dispatch table; unknown commands are ignored as before
+    handlers = {
+        "acquirePrtSsoCookie": handle_acquire_prt_sso_cookie,
+        "acquireTokenSilently": handle_acquire_token_silently,
+        "getAccounts": lambda _msg: respond("getAccounts", ssomib.get_accounts()),
+        "getVersion": lambda _msg: respond("getVersion", ssomib.get_broker_version()),
+    }
 
     def run_dbus_monitor():
         # inform other side about initial state
@@ -246,17 +351,29 @@ def run_as_native_messaging():
     ssomib.on_broker_state_changed(notify_state_change)
     monitor = Thread(target=run_dbus_monitor)
     monitor.start()
+    # bind the per-message callables to locals once, so each
+    # iteration runs on LOAD_FAST instead of repeated global and
+    # attribute lookups
+    get_message = NativeMessaging.get_message
+    get_handler = handlers.get
     while True:
-        received_message = NativeMessaging.get_message()
+        received_message = get_message()
         with iomutex:
             cmd = received_message["command"]
+            handler = get_handler(cmd)
+            if not handler:
+                continue
             try:
-                handle_command(cmd, received_message)
+                handler(received_message)
             except Exception:  # pylint: disable=broad-except
                 respond(cmd, no_broker)
 
 
 def run_interactive():
+    # only interactive mode needs argument parsing; keep the import
+    # out of the native-messaging startup path the browser pays for
+    import argparse  # pylint: disable=import-outside-toplevel
+
     def _get_account(accounts, idx):
         try:
             return accounts["accounts"][idx]